@@ -5,39 +5,1811 @@ import json
 import requests
 import io
 import datetime # Import datetime for time calculations
+import threading
+import re
+import unicodedata
+import os
+import mmap
+import struct
+from array import array
+import mutagen
+from collections import OrderedDict, deque
+import sys
+import time
+import queue
+import select
+import ctypes
+import ctypes.util
+import hashlib
+import sqlite3
+import difflib
+import multiprocessing
+import urllib.parse
+from types import SimpleNamespace
+import math
+import base64
+import atexit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from mutagen.id3 import ID3, APIC, TPE1, TALB, TDRC, TCON
+from mutagen.flac import FLAC, Picture
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.oggvorbis import OggVorbis
+
+try:
+    from PIL import Image  # Optional, only needed to control JPEG quality of embedded art
+except ImportError:
+    Image = None
+try:
+    import fcntl  # POSIX only; elsewhere the negative cache is locked with an exclusive lock file
+except ImportError:
+    fcntl = None
+
+# Delay after the last keystroke before a search-as-you-type query is sent
+SEARCH_DEBOUNCE_MS = 300
+MAX_SUGGESTIONS = 5
+# Number of (query, page) search results and full releases kept in memory
+SEARCH_CACHE_SIZE = 500
+RELEASE_CACHE_SIZE = 1000
+# Default input box texts that must never be sent as a real query
+PLACEHOLDER_TEXTS = {'artist', 'title', 'artist - title'}
+# Watch mode: seconds a file must go without events before it is processed,
+# and the bounds that make large imports apply backpressure
+WATCH_SETTLE_SECONDS = 2.0
+WATCH_QUEUE_SIZE = 64
+WATCH_MAX_PENDING = 10000
+# Embedded cover art: longest side in pixels, JPEG quality (Pillow only), cache directory
+ART_SIZE = 500
+ART_QUALITY = 85
+ART_CACHE_DIR = 'art_cache'
+ART_WORKERS = 8
+ART_MEMORY_CACHE_SIZE = 200  # Encoded covers kept in memory; the disk cache covers the rest
+# Work queue: lease length, retry limit, and the Discogs authenticated rate limit per token
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 5
+DISCOGS_REQUESTS_PER_MINUTE = 60
+# Lowest title similarity (0..1) at which a release is written into a file; weaker matches are left untouched
+MIN_MATCH_SCORE = 0.6
+# Optional local lookup service shared by every GUI and batch client on this machine
+LOOKUP_SERVICE_HOST = '127.0.0.1'
+LOOKUP_SERVICE_PORT = 8765
+LOOKUP_SERVICE_IMAGE_CACHE_SIZE = 1000
+LOOKUP_SERVICE_JSON_CACHE_SIZE = 5000
+LOOKUP_SERVICE_TIMEOUT = 10
+# Negative cache: how long an empty 45rpm page is trusted, how many are kept, and the
+# sizing of the filter of release ids known not to be 7" 45 RPM vinyl
+NEGATIVE_CACHE_FILE = 'negative_cache.json'
+NEGATIVE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+NEGATIVE_CACHE_MAX_PAGES = 100000
+NEGATIVE_CACHE_LOCK_STALE_SECONDS = 30  # Lock files older than this were left by a crashed save (no fcntl only)
+NON_45_FILTER_CAPACITY = 1000000
+NON_45_FILTER_ERROR_RATE = 0.001
+# Memory and count caps for result pages kept warm in the navigation history
+PAGE_HISTORY_MAX_BYTES = 64 * 1024 * 1024
+PAGE_HISTORY_MAX_PAGES = 50
 
 # Initialize Discogs client
 d = discogs_client.Client('YourApp/1.0', user_token=config.DISCOGS_USER_TOKEN)
 
-def search_discogs(query, page=1, search_type='release'):
+class BloomFilter:
+    """
+    Fixed-size set of integers with no false negatives and a false-positive rate
+    of about error_rate while it holds at most capacity items.
+    """
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = size
+        self.hash_count = max(1, round(size / capacity * math.log(2)))
+        self.bits = bytearray((size + 7) // 8) if bits is None else bits
+        self.count = count
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(str(item).encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def merge(self, other):
+        """
+        Adds every item of another filter with the same parameters. The item count is
+        re-estimated from the number of set bits, since the two filters may share items.
+        """
+        self.bits = bytearray(a | b for a, b in zip(self.bits, other.bits))
+        set_bits = int.from_bytes(self.bits, 'little').bit_count()
+        if set_bits >= self.size:
+            self.count = self.capacity
+        else:
+            self.count = round(-self.size / self.hash_count * math.log(1 - set_bits / self.size))
+
+class NegativeCache:
+    """
+    Remembers work that found nothing so it is not paid for again: search pages with
+    no 45rpm releases (per query, expiring after ttl) and release ids known not to be
+    7" 45 RPM vinyl. Release ids go into two rotating Bloom filters, so memory stays
+    fixed and the false-positive rate stays near 2 * NON_45_FILTER_ERROR_RATE.
+    The cache is saved to disk at exit so batch re-runs skip the same dead ends;
+    saves from several processes are merged rather than overwriting each other.
+    """
+    def __init__(self, file_path=NEGATIVE_CACHE_FILE, ttl=NEGATIVE_CACHE_TTL_SECONDS, max_pages=NEGATIVE_CACHE_MAX_PAGES):
+        self.file_path = file_path
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.lock = threading.Lock()
+        self.dead_pages = OrderedDict()  # 64-bit hash of (query, page, type) -> expiry time
+        self.non_45 = BloomFilter(NON_45_FILTER_CAPACITY, NON_45_FILTER_ERROR_RATE)
+        self.previous_non_45 = None
+        self.changed = False
+
+    @staticmethod
+    def _page_key(query, page, search_type):
+        key = f"{normalize_search_query(query)}\0{page}\0{search_type}".encode('utf-8')
+        return struct.unpack('<Q', hashlib.blake2b(key, digest_size=8).digest())[0]
+
+    def is_dead_page(self, query, page, search_type='release'):
+        key = self._page_key(query, page, search_type)
+        with self.lock:
+            expiry = self.dead_pages.get(key)
+            if expiry is None:
+                return False
+            if expiry < time.time():
+                del self.dead_pages[key]
+                return False
+            return True
+
+    def mark_dead_page(self, query, page, search_type='release'):
+        key = self._page_key(query, page, search_type)
+        with self.lock:
+            self.dead_pages.pop(key, None)
+            self.dead_pages[key] = time.time() + self.ttl
+            while len(self.dead_pages) > self.max_pages:
+                self.dead_pages.popitem(last=False)
+            self.changed = True
+
+    def is_known_non_45(self, release_id):
+        with self.lock:
+            return release_id in self.non_45 or (self.previous_non_45 is not None and release_id in self.previous_non_45)
+
+    def mark_non_45(self, release_id):
+        with self.lock:
+            if self.non_45.is_full():
+                self.previous_non_45 = self.non_45
+                self.non_45 = BloomFilter(NON_45_FILTER_CAPACITY, NON_45_FILTER_ERROR_RATE)
+            self.non_45.add(release_id)
+            self.changed = True
+
+    def save(self):
+        """
+        Writes the cache to disk, merged with whatever other processes saved since it was
+        loaded: dead pages are united and Bloom filters OR-ed. A lock file serializes
+        concurrent savers so no process overwrites another's entries.
+        """
+        with self.lock:
+            if not self.changed:
+                return
+        lock_path = f"{self.file_path}.lock"
+        if fcntl is not None:
+            with open(lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._write_merged()
+        else:
+            self._create_lock_file(lock_path)
+            try:
+                self._write_merged()
+            finally:
+                os.remove(lock_path)
+
+    def _create_lock_file(self, lock_path):
+        """Waits until this process is the one that created the lock file."""
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.path.getmtime(lock_path) > NEGATIVE_CACHE_LOCK_STALE_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue  # Released while we were checking it
+            time.sleep(0.05)
+
+    def _write_merged(self):
+        # Caller holds the lock file
+        on_disk = self._read()
+        with self.lock:
+            if on_disk is not None:
+                self._merge(*on_disk)
+            now = time.time()
+            filters = [f for f in (self.previous_non_45, self.non_45) if f is not None]
+            data = {
+                'dead_pages': [[key, expiry] for key, expiry in self.dead_pages.items() if expiry >= now],
+                'non_45': [{'capacity': f.capacity, 'error_rate': f.error_rate, 'count': f.count,
+                            'bits': base64.b64encode(f.bits).decode('ascii')} for f in filters],
+            }
+            self.changed = False
+        temp_path = f"{self.file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.file_path)
+
+    def _read(self):
+        """Returns (dead pages, Bloom filters oldest first) from the cache file, or None if missing or unreadable."""
+        if not os.path.exists(self.file_path):
+            return None
+        try:
+            with open(self.file_path) as f:
+                data = json.load(f)
+            now = time.time()
+            dead_pages = OrderedDict((int(key), float(expiry)) for key, expiry in data['dead_pages'] if expiry >= now)
+            filters = []
+            for entry in data['non_45']:
+                bits = bytearray(base64.b64decode(entry['bits']))
+                bloom_filter = BloomFilter(entry['capacity'], entry['error_rate'], bits, entry['count'])
+                if len(bits) != (bloom_filter.size + 7) // 8:
+                    raise ValueError("Bloom filter size does not match its parameters")
+                filters.append(bloom_filter)
+        except Exception as e:
+            print(f"Ignoring unreadable negative cache {self.file_path}: {e}")
+            return None
+        return dead_pages, filters
+
+    def _merge(self, dead_pages, filters):
+        # Caller holds self.lock
+        for key, expiry in dead_pages.items():
+            if expiry > self.dead_pages.get(key, 0):
+                self.dead_pages[key] = expiry
+        while len(self.dead_pages) > self.max_pages:
+            self.dead_pages.popitem(last=False)
+        # Pair current with current and previous with previous
+        ours = [self.non_45, self.previous_non_45]
+        theirs = list(reversed(filters))
+        for position, other in enumerate(theirs[:2]):
+            own = ours[position]
+            if own is None:
+                if position == 1:
+                    self.previous_non_45 = other
+            elif (own.size, own.hash_count) == (other.size, other.hash_count):
+                own.merge(other)
+
+    def load(self):
+        on_disk = self._read()
+        if on_disk is None:
+            return
+        dead_pages, filters = on_disk
+        with self.lock:
+            self.dead_pages = dead_pages
+            if filters:
+                self.non_45 = filters[-1]
+                self.previous_non_45 = filters[0] if len(filters) > 1 else None
+
+negative_cache = NegativeCache()
+negative_cache.load()
+atexit.register(negative_cache.save)
+
+def search_discogs(query, page=1, search_type='release', cancel_event=None):
     """
     Searches the Discogs database for releases and returns a list of 45rpm releases for a given page.
+    If cancel_event is set, the search stops before its next request to Discogs.
+    Pages and releases recorded in the negative cache are skipped without any API calls.
+    Returns None if the search failed, so callers can tell an error from an empty page.
     """
+    if negative_cache.is_dead_page(query, page, search_type):
+        print(f"\nSkipping '{query}' (page: {page}): known to have no 45rpm releases.")
+        return []
+    def cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            print(f"Search for '{query}' cancelled.")
+            return True
+        return False
+
     print(f"\nSearching Discogs for '{query}' (page: {page}, type: {search_type})...")
     release_list = []
     try:
+        if cancelled():
+            return release_list
+        # discogs_client is lazy: the first request is sent by results.pages, the page by results.page()
         results = d.search(query, type=search_type)
+        if cancelled():
+            return release_list
         if results and page <= results.pages:
             print(f"Found {results.count} results. Filtering for 45rpm releases on page {page}.")
+            if cancelled():
+                return release_list
             for result in results.page(page):
                 if len(release_list) >= 10:
                     break
                 if isinstance(result, discogs_client.models.Release):
+                    if negative_cache.is_known_non_45(result.id):
+                        continue
+                    # Reading formats may fetch the full release
+                    if cancelled():
+                        return release_list
                     is_45rpm = any(
                         format_entry.get('name') == 'Vinyl' and '7"' in format_entry.get('descriptions', []) and '45 RPM' in format_entry.get('descriptions', [])
                         for format_entry in result.formats or []
                     )
                     if is_45rpm:
                         release_list.append(result)
+                    else:
+                        negative_cache.mark_non_45(result.id)
 
             if not release_list:
                 print(f"No 45rpm releases found on page {page}.")
+                negative_cache.mark_dead_page(query, page, search_type)
         else:
             print(f"  No {search_type} results found for '{query}' or page {page} out of range.")
+            negative_cache.mark_dead_page(query, page, search_type)
     except Exception as e:
         print(f"An unexpected error occurred during search: {e}")
+        return None
     return release_list
 
+# All leading articles are dropped at once so normalizing twice gives the same key ("the a team" -> "team")
+LEADING_ARTICLE_RE = re.compile(r"^(?:(?:the|a|an)\s+)+")
+# A featuring marker only counts after other text and before a featured name,
+# so "Little Feat" and "Ft. Knox" are left alone
+FEATURING_RE = re.compile(r"(?<=\S)\s+[\(\[]?(feat|ft|featuring)\b\.?\s+\S.*$")
+INNER_PUNCTUATION_RE = re.compile(r"(?<=\w)[^\w\s]+(?=\w)")
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+WHITESPACE_RE = re.compile(r"\s+")
+# Spaces around hyphens are dropped from punctuation-only names so they never contain the " - " separator
+HYPHEN_SPACING_RE = re.compile(r"\s*-\s*")
+
+def normalize_query_part(text):
+    """
+    Canonicalizes an artist or title: strips accents, folds case, drops leading
+    articles and featured artists, and removes punctuation and extra whitespace.
+    Names made only of punctuation (e.g. "!!!") keep their folded raw text.
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold().strip()
+    if text in PLACEHOLDER_TEXTS:
+        return ""
+    raw = text
+    text = text.replace('&', ' and ')
+    text = FEATURING_RE.sub('', text)
+    # Punctuation inside a word is dropped ("a-ha" -> "aha", "don't" -> "dont")
+    text = INNER_PUNCTUATION_RE.sub('', text)
+    text = PUNCTUATION_RE.sub(' ', text)
+    text = WHITESPACE_RE.sub(' ', text).strip()
+    if not text:
+        return HYPHEN_SPACING_RE.sub('-', WHITESPACE_RE.sub(' ', raw).strip())
+    return LEADING_ARTICLE_RE.sub('', text) or text
+
+def normalize_query(artist, title):
+    """
+    Builds the canonical "artist - title" key, leaving out parts that are empty or placeholders.
+    """
+    parts = [normalize_query_part(artist), normalize_query_part(title)]
+    return " - ".join(part for part in parts if part)
+
+def normalize_search_query(query):
+    """
+    Canonicalizes a raw "Artist - Title" query string. Normalizing an already
+    normalized query returns it unchanged.
+    """
+    if query.strip().casefold() in PLACEHOLDER_TEXTS:
+        return ""
+    if " - " in query:
+        artist, title = query.split(" - ", 1)
+        return normalize_query(artist, title)
+    return normalize_query_part(query)
+
+def format_query(artist, title):
+    """Builds the "Artist - Title" text sent to Discogs, leaving out empty or placeholder parts."""
+    parts = [text.strip() for text in (artist, title) if text.strip() and text.strip().casefold() not in PLACEHOLDER_TEXTS]
+    return " - ".join(parts)
+
+def group_queries(queries):
+    """
+    Groups raw queries from a batch run by their normalized key so each distinct
+    search is only issued once. Returns normalized key -> positions in queries;
+    empty and placeholder queries are dropped.
+    """
+    groups = OrderedDict()
+    for position, query in enumerate(queries):
+        key = normalize_search_query(query)
+        if key:
+            groups.setdefault(key, []).append(position)
+    return groups
+
+def rank_releases(query, releases):
+    """
+    Picks the release whose title best matches a normalized query. Releases may be
+    discogs_client objects or dicts with a 'title'. Returns (release, score) with
+    score in 0..1, or (None, 0.0) when there are no releases.
+    """
+    def score(release):
+        title = release.get('title', '') if isinstance(release, dict) else getattr(release, 'title', '')
+        return difflib.SequenceMatcher(None, query, normalize_search_query(title or '')).ratio()
+    scored = [(score(release), position) for position, release in enumerate(releases)]
+    if not scored:
+        return None, 0.0
+    # Ties keep Discogs' own ordering
+    best_score, position = max(scored, key=lambda item: (item[0], -item[1]))
+    return releases[position], best_score
+
+# Search results keyed by (normalized query, page) so repeated queries never hit the API twice.
+# Least recently used entries are dropped beyond SEARCH_CACHE_SIZE.
+search_cache = OrderedDict()
+search_cache_lock = threading.Lock()
+# Searches currently running, so concurrent requests for the same key wait for one result
+search_inflight = {}
+
+def get_cached_search(query, page=1):
+    """Returns cached results for a query, or None if it has not been searched yet."""
+    key = (normalize_search_query(query), page)
+    with search_cache_lock:
+        results = search_cache.get(key)
+        if results is not None:
+            search_cache.move_to_end(key)
+        return results
+
+def cached_search_discogs(query, page=1, cancel_event=None):
+    """
+    Returns search_discogs() results from the local cache, querying Discogs only on a miss.
+    Identical concurrent queries are coalesced into a single request.
+    Failed and cancelled searches are not cached; a failed search returns None.
+    The user's query text is what gets sent; its normalized form is only the cache key.
+    """
+    normalized = normalize_search_query(query)
+    if not normalized:
+        return []
+    key = (normalized, page)
+    while True:
+        with search_cache_lock:
+            if key in search_cache:
+                search_cache.move_to_end(key)
+                return search_cache[key]
+            done_event = search_inflight.get(key)
+            if done_event is None:
+                done_event = threading.Event()
+                search_inflight[key] = done_event
+                break
+        done_event.wait()
+    try:
+        results = None
+        if lookup_service is not None:
+            results = remote_search(query, page)
+        # Also covers a lookup service that went away during remote_search()
+        if lookup_service is None:
+            results = search_discogs(query, page=page, cancel_event=cancel_event)
+        if results is not None and (cancel_event is None or not cancel_event.is_set()):
+            with search_cache_lock:
+                search_cache[key] = results
+                while len(search_cache) > SEARCH_CACHE_SIZE:
+                    search_cache.popitem(last=False)
+    finally:
+        with search_cache_lock:
+            del search_inflight[key]
+        done_event.set()
+    return results
+
+class SuggestionSearcher:
+    """
+    Debounced search-as-you-type. Runs at most one background query at a time,
+    cancels queries that have been superseded by newer typing and serves cached
+    queries immediately.
+    """
+    def __init__(self, delay_ms=SEARCH_DEBOUNCE_MS):
+        self.delay_ms = delay_ms
+        self.lock = threading.Lock()
+        self.query = ""          # Query the current suggestions belong to
+        self.suggestions = []
+        self.pending_query = None
+        self.inflight_query = None
+        self.last_edit_ms = 0
+        self.worker = None
+        self.cancel_event = None
+
+    def update(self, query, now_ms):
+        """Called every frame with the current query text."""
+        if self.pending_query is not None:
+            if query == self.pending_query:
+                return
+        elif query == self.query or query == self.inflight_query:
+            return
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.inflight_query = None
+        cached = get_cached_search(query)
+        if not query or cached is not None:
+            with self.lock:
+                self.query = query
+                self.suggestions = (cached or [])[:MAX_SUGGESTIONS]
+            self.pending_query = None
+            return
+        self.pending_query = query
+        self.last_edit_ms = now_ms
+
+    def tick(self, now_ms):
+        """Starts the pending query once typing has paused and no query is in flight."""
+        if self.pending_query is None or now_ms - self.last_edit_ms < self.delay_ms:
+            return
+        if self.worker is not None and self.worker.is_alive():
+            return
+        query = self.pending_query
+        self.pending_query = None
+        self.inflight_query = query
+        self.cancel_event = threading.Event()
+        self.worker = threading.Thread(target=self._run, args=(query, self.cancel_event), daemon=True)
+        self.worker.start()
+
+    def _run(self, query, cancel_event):
+        results = cached_search_discogs(query, cancel_event=cancel_event)
+        if cancel_event.is_set():
+            return
+        with self.lock:
+            self.query = query
+            # Keep the previous suggestions if the search failed
+            if results is not None:
+                self.suggestions = results[:MAX_SUGGESTIONS]
+        self.inflight_query = None
+
+    def draw(self, screen, x, y):
+        with self.lock:
+            suggestions = list(self.suggestions)
+        for result in suggestions:
+            title = getattr(result, 'title', 'N/A').encode('latin-1', 'replace').decode('latin-1')
+            text_surface = FONT.render(title, True, (200, 200, 200))
+            screen.blit(text_surface, (x, y))
+            y += 30
+
+def build_search_query(artist_box, title_box):
+    """
+    Builds the search query from the input boxes, ignoring boxes still showing their placeholder.
+    """
+    artist, title = [box.text if box.text != box.placeholder_text else "" for box in (artist_box, title_box)]
+    return format_query(artist, title)
+
+UNMATCHED_SCORE = -1.0  # match_score of tracks that have not been looked up yet
+MUSIC_FILE_EXTENSIONS = ('.mp3', '.flac', '.ogg', '.m4a', '.wav')
+LIBRARY_FILE_MAGIC = b'MFCLIB1\n'
+
+class StringColumn:
+    """
+    Strings stored once in a shared UTF-8 buffer with an offsets array; each row
+    holds an integer string id. Interned columns (artist, album) store each distinct
+    value once; non-interned columns (paths, titles) store one string per row, since
+    their values are mostly distinct and the interning dict would cost more than it saves.
+    """
+    def __init__(self, intern=True):
+        self.intern = intern
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+        self.rows = array('I')
+        self.ids = {}
+
+    def add_string(self, text):
+        if self.intern and text in self.ids:
+            return self.ids[text]
+        self.data += text.encode('utf-8')
+        self.offsets.append(len(self.data))
+        string_id = len(self.offsets) - 2
+        if self.intern:
+            self.ids[text] = string_id
+        return string_id
+
+    def append(self, text):
+        self.rows.append(self.add_string(text or ''))
+
+    def value(self, string_id):
+        return bytes(self.data[self.offsets[string_id]:self.offsets[string_id + 1]]).decode('utf-8')
+
+    def __getitem__(self, row):
+        return self.value(self.rows[row])
+
+    def distinct_count(self):
+        return len(self.offsets) - 1
+
+class LibraryTable:
+    """
+    Columnar in-memory table of library tracks. Tag strings live in StringColumns
+    and numeric fields in typed arrays, so a track costs tens of bytes rather than
+    a dict or EasyID3 object. Row selections are passed around as array('I') of row indices.
+    """
+    STRING_COLUMNS = {'path': False, 'artist': True, 'title': False, 'album': True}
+    NUMERIC_COLUMNS = {'duration': 'd', 'size': 'q', 'mtime': 'd', 'year': 'i', 'match_score': 'f', 'release_id': 'q'}
+
+    def __init__(self):
+        self.columns = {name: StringColumn(intern) for name, intern in self.STRING_COLUMNS.items()}
+        self.columns.update({name: array(typecode) for name, typecode in self.NUMERIC_COLUMNS.items()})
+        self.read_only = False
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.columns['match_score'])
+
+    def append(self, path, artist='', title='', album='', duration=0.0, size=0, mtime=0.0, year=0, match_score=UNMATCHED_SCORE, release_id=0):
+        if self.read_only:
+            raise ValueError("Library table loaded from disk cannot be appended to.")
+        values = {'path': path, 'artist': artist, 'title': title, 'album': album, 'duration': duration,
+                  'size': size, 'mtime': mtime, 'year': year, 'match_score': match_score, 'release_id': release_id}
+        for name, value in values.items():
+            self.columns[name].append(value)
+
+    def row(self, index):
+        return {name: self.columns[name][index] for name in self.columns}
+
+    def all_rows(self):
+        return array('I', range(len(self)))
+
+    def where(self, column, predicate, rows=None):
+        """
+        Returns the rows whose column value satisfies predicate. For string columns the
+        predicate runs once per distinct string rather than once per row.
+        """
+        rows = self.all_rows() if rows is None else rows
+        values = self.columns[column]
+        if isinstance(values, StringColumn):
+            matches = {}
+            ids = values.rows
+            selected = array('I')
+            for row in rows:
+                string_id = ids[row]
+                if string_id not in matches:
+                    matches[string_id] = predicate(values.value(string_id))
+                if matches[string_id]:
+                    selected.append(row)
+            return selected
+        return array('I', (row for row in rows if predicate(values[row])))
+
+    def unmatched(self, rows=None):
+        return self.where('match_score', lambda score: score < 0, rows)
+
+    def sort(self, column, rows=None, reverse=False):
+        rows = self.all_rows() if rows is None else rows
+        values = self.columns[column]
+        if isinstance(values, StringColumn):
+            # Sort the distinct strings once, then sort rows by their string's rank
+            ids = values.rows
+            distinct = sorted(set(ids[row] for row in rows), key=values.value)
+            rank = {string_id: position for position, string_id in enumerate(distinct)}
+            key = lambda row: rank[ids[row]]
+        else:
+            key = values.__getitem__
+        return array('I', sorted(rows, key=key, reverse=reverse))
+
+    def group_by(self, column, rows=None):
+        """Groups rows by the value of a column, e.g. group_by('artist', table.unmatched())."""
+        rows = self.all_rows() if rows is None else rows
+        values = self.columns[column]
+        groups = {}
+        if isinstance(values, StringColumn) and not values.intern:
+            for row in rows:
+                groups.setdefault(values[row], array('I')).append(row)
+            return groups
+        if isinstance(values, StringColumn):
+            ids = values.rows
+            for row in rows:
+                groups.setdefault(ids[row], array('I')).append(row)
+            return {values.value(string_id): group for string_id, group in groups.items()}
+        for row in rows:
+            groups.setdefault(values[row], array('I')).append(row)
+        return groups
+
+    def _buffers(self):
+        for name, column in self.columns.items():
+            if isinstance(column, StringColumn):
+                yield f"{name}.data", 'B', column.data
+                yield f"{name}.offsets", 'Q', column.offsets
+                yield f"{name}.rows", 'I', column.rows
+            else:
+                yield name, column.typecode if isinstance(column, array) else column.format, column
+
+    def save(self, file_path):
+        """
+        Writes the table as a JSON header followed by 8-byte aligned raw column buffers
+        in native byte order, so load() can map them without copying. The file is
+        replaced atomically, so a table can be saved over the file it was loaded from.
+        """
+        header = {'rows': len(self), 'buffers': {}}
+        offset = 0
+        buffers = []
+        for name, typecode, buffer in self._buffers():
+            data = memoryview(buffer).cast('B')
+            header['buffers'][name] = [offset, len(data), typecode]
+            buffers.append(data)
+            offset += (len(data) + 7) // 8 * 8
+        header_bytes = json.dumps(header).encode('utf-8')
+        header_length = (len(LIBRARY_FILE_MAGIC) + 8 + len(header_bytes) + 7) // 8 * 8
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(LIBRARY_FILE_MAGIC + struct.pack('<Q', header_length))
+            f.write(header_bytes.ljust(header_length - len(LIBRARY_FILE_MAGIC) - 8, b' '))
+            for data in buffers:
+                f.write(data)
+                f.write(b'\0' * ((8 - len(data) % 8) % 8))
+        os.replace(temp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Memory-maps a saved table, paging in columns on demand. Rows cannot be appended,
+        but numeric cells (match_score, release_id) can be updated in a private
+        copy-on-write mapping and written back with save().
+        """
+        table = cls()
+        with open(file_path, 'rb') as f:
+            if f.read(len(LIBRARY_FILE_MAGIC)) != LIBRARY_FILE_MAGIC:
+                raise ValueError(f"{file_path} is not a saved library table.")
+            header_length = struct.unpack('<Q', f.read(8))[0]
+            header = json.loads(f.read(header_length - len(LIBRARY_FILE_MAGIC) - 8))
+            table._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(table._mmap)
+        buffers = {}
+        for name, (offset, length, typecode) in header['buffers'].items():
+            start = header_length + offset
+            buffers[name] = view[start:start + length].cast(typecode)
+        for name, column in table.columns.items():
+            if isinstance(column, StringColumn):
+                column.data = buffers[f"{name}.data"]
+                column.offsets = buffers[f"{name}.offsets"]
+                column.rows = buffers[f"{name}.rows"]
+            else:
+                table.columns[name] = buffers[name]
+        table.read_only = True
+        return table
+
+# Easy tag names -> ID3 frame ids, for WAV files whose ID3 chunk has no easy-tag wrapper
+ID3_TEXT_FRAMES = {'artist': 'TPE1', 'title': 'TIT2', 'album': 'TALB', 'date': 'TDRC', 'genre': 'TCON'}
+
+def read_track_tags(file_path):
+    """
+    Reads the tags and stream info used by the library table from a music file.
+    Returns None if the file cannot be read.
+    """
+    try:
+        audio = mutagen.File(file_path, easy=True)
+        stat = os.stat(file_path)
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+    tags = audio.tags if audio is not None and audio.tags is not None else {}
+    if isinstance(tags, ID3):
+        tags = {key: [str(text) for text in tags[frame_id].text]
+                for key, frame_id in ID3_TEXT_FRAMES.items() if frame_id in tags}
+    year = 0
+    date = (tags.get('date') or [''])[0]
+    if date[:4].isdigit():
+        year = int(date[:4])
+    return {
+        'artist': (tags.get('artist') or [''])[0],
+        'title': (tags.get('title') or [''])[0],
+        'album': (tags.get('album') or [''])[0],
+        'duration': audio.info.length if audio is not None and audio.info else 0.0,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'year': year,
+    }
+
+def scan_library(roots, table=None):
+    """Walks the library roots and appends every readable music file to a LibraryTable."""
+    table = LibraryTable() if table is None else table
+    for root in roots:
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                if not file_name.lower().endswith(MUSIC_FILE_EXTENSIONS):
+                    continue
+                file_path = os.path.join(dir_path, file_name)
+                tags = read_track_tags(file_path)
+                if tags is not None:
+                    table.append(file_path, **tags)
+    return table
+
+def match_library(table_path):
+    """Looks up the unmatched tracks of a saved library table and saves the results back."""
+    connect_lookup_service()
+    table = LibraryTable.load(table_path)
+    search_library(table)
+    table.save(table_path)
+    unmatched = table.where('release_id', lambda release_id: release_id <= 0)
+    print(f"{len(table) - len(unmatched)} of {len(table)} tracks matched. Unmatched tracks by artist:")
+    for artist, rows in sorted(table.group_by('artist', unmatched).items(), key=lambda item: -len(item[1]))[:20]:
+        print(f"  {artist or 'N/A'}: {len(rows)}")
+
+def search_library(table, rows=None):
+    """
+    Looks up unmatched tracks in bulk. Rows are grouped by normalized artist/title so
+    each distinct query is searched once, and every row's match_score is set to the
+    best title similarity (0.0 when no 45rpm releases were found). release_id is only
+    set when that score reaches MIN_MATCH_SCORE. Returns a dict of normalized query -> releases.
+    """
+    artists, titles = table.columns['artist'], table.columns['title']
+    unmatched_rows = table.unmatched(rows)
+    queries = [format_query(artists[row], titles[row]) for row in unmatched_rows]
+    groups = group_queries(queries)
+    print(f"Searching Discogs for {len(groups)} distinct queries.")
+    found = {}
+    for key, positions in groups.items():
+        results = cached_search_discogs(queries[positions[0]])
+        if results is None:
+            continue  # Search failed; leave the rows unmatched so a later run retries them
+        found[key] = results
+        best, score = rank_releases(key, results)
+        for position in positions:
+            table.columns['match_score'][unmatched_rows[position]] = score
+            if best is not None and score >= MIN_MATCH_SCORE:
+                table.columns['release_id'][unmatched_rows[position]] = best.id
+    return found
+
+def clean_music_file(file_path):
+    """
+    Reads the tags of a music file and prints them. Returns the tags, or None if the file cannot be read.
+    """
+    tags = read_track_tags(file_path)
+    if tags is not None:
+        print(f"Cleaning {file_path}...")
+        print(f"Artist: {tags['artist']}")
+        print(f"Title: {tags['title']}")
+        print(f"Album: {tags['album']}")
+    return tags
+
+def tag_music_file(file_path, release_id):
+    """
+    Writes the artist, album, year and genre of a matched Discogs release into a music file.
+    """
+    try:
+        full_release = lookup_release(release_id)
+        audio = mutagen.File(file_path, easy=True)
+        if audio is None:
+            return False
+        if audio.tags is None:
+            audio.add_tags()
+        if isinstance(audio.tags, ID3):
+            # WAV has no easy-tag wrapper, so its ID3 chunk takes frames directly
+            if full_release.artists:
+                audio.tags.add(TPE1(encoding=3, text=[full_release.artists[0].name]))
+            audio.tags.add(TALB(encoding=3, text=[full_release.title]))
+            if full_release.year:
+                audio.tags.add(TDRC(encoding=3, text=[str(full_release.year)]))
+            if full_release.genres:
+                audio.tags.add(TCON(encoding=3, text=list(full_release.genres)))
+        else:
+            if full_release.artists:
+                audio['artist'] = full_release.artists[0].name
+            audio['album'] = full_release.title
+            if full_release.year:
+                audio['date'] = str(full_release.year)
+            if full_release.genres:
+                audio['genre'] = full_release.genres
+        audio.save()
+        print(f"Tagged {file_path} from release {release_id}.")
+        return True
+    except Exception as e:
+        print(f"Error tagging {file_path}: {e}")
+        return False
+
+def encode_cover_art(image_data, size=ART_SIZE, quality=ART_QUALITY):
+    """
+    Downsizes image data so its longest side is at most size pixels and re-encodes it as JPEG.
+    Uses Pillow when installed, otherwise pygame (which ignores quality).
+    """
+    if Image is not None:
+        image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+    surface = pygame.image.load(io.BytesIO(image_data))
+    scale = min(1.0, size / max(surface.get_width(), surface.get_height()))
+    if scale < 1.0:
+        surface = pygame.transform.smoothscale(surface, (round(surface.get_width() * scale), round(surface.get_height() * scale)))
+    output = io.BytesIO()
+    pygame.image.save(surface, output, 'cover.jpg')
+    return output.getvalue()
+
+class CoverArtCache:
+    """
+    Fetches and encodes each release's cover once. Encoded art is kept on disk under
+    cache_dir, so later runs skip the download; releases without an image get an empty
+    marker file. The ART_MEMORY_CACHE_SIZE most recently used covers are also kept in
+    memory, where identical images share one bytes object across releases and tracks.
+    Failed downloads are not cached and are retried on the next request.
+    """
+    def __init__(self, cache_dir=ART_CACHE_DIR, size=ART_SIZE, quality=ART_QUALITY, max_entries=ART_MEMORY_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.quality = quality
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.release_locks = {}
+        self.by_release = OrderedDict()  # Release id -> SHA-1 of its encoded art, or None if it has no image
+        self.by_digest = {}              # SHA-1 -> [shared bytes object, number of releases using it]
+
+    def _cache_path(self, release_id):
+        return os.path.join(self.cache_dir, f"{release_id}-{self.size}-{self.quality}.jpg")
+
+    def _lookup(self, release_id):
+        # Caller holds self.lock. Returns (found, art).
+        if release_id not in self.by_release:
+            return False, None
+        self.by_release.move_to_end(release_id)
+        digest = self.by_release[release_id]
+        return True, None if digest is None else self.by_digest[digest][0]
+
+    def _remember(self, release_id, art):
+        with self.lock:
+            digest = None
+            if art is not None:
+                digest = hashlib.sha1(art).hexdigest()
+                entry = self.by_digest.setdefault(digest, [art, 0])
+                entry[1] += 1
+                art = entry[0]
+            self.by_release[release_id] = digest
+            while len(self.by_release) > self.max_entries:
+                _, evicted = self.by_release.popitem(last=False)
+                if evicted is not None:
+                    self.by_digest[evicted][1] -= 1
+                    if self.by_digest[evicted][1] == 0:
+                        del self.by_digest[evicted]
+            return art
+
+    def get(self, release_id):
+        """Returns the encoded cover art for a release id, or None if it has none or it could not be fetched."""
+        with self.lock:
+            found, art = self._lookup(release_id)
+            if found:
+                return art
+            release_lock = self.release_locks.setdefault(release_id, threading.Lock())
+        # Parallel workers asking for the same release wait for a single download
+        with release_lock:
+            with self.lock:
+                found, art = self._lookup(release_id)
+            if not found:
+                try:
+                    art = self._remember(release_id, self._load(release_id))
+                except Exception as e:
+                    print(f"Error loading cover art for release {release_id}: {e}")
+                    art = None
+        with self.lock:
+            self.release_locks.pop(release_id, None)
+        return art
+
+    def _load(self, release_id):
+        cache_path = self._cache_path(release_id)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                return f.read() or None
+        full_release = lookup_release(release_id)
+        art = b''
+        if full_release.images:
+            art = encode_cover_art(fetch_image_data(full_release.images[0]['uri']), self.size, self.quality)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(art)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            print(f"Could not write cover art cache {cache_path}: {e}")
+        return art or None
+
+cover_art_cache = CoverArtCache()
+
+def make_cover_picture(art):
+    picture = Picture()
+    picture.type = 3  # Front cover
+    picture.mime = 'image/jpeg'
+    picture.desc = 'Cover'
+    picture.data = art
+    return picture
+
+def embed_cover_art(file_path, art):
+    """
+    Embeds JPEG art as the front cover of a music file: an APIC frame for MP3 and WAV,
+    a picture block for FLAC, covr for M4A and METADATA_BLOCK_PICTURE for Ogg Vorbis.
+    Files that already carry identical art are left untouched. Returns True if the file was written.
+    """
+    try:
+        audio = mutagen.File(file_path)
+        if audio is None:
+            return False
+        if isinstance(audio, FLAC):
+            if len(audio.pictures) == 1 and audio.pictures[0].data == art:
+                return False
+            audio.clear_pictures()
+            audio.add_picture(make_cover_picture(art))
+        elif isinstance(audio, OggVorbis):
+            encoded = base64.b64encode(make_cover_picture(art).write()).decode('ascii')
+            if audio.get('metadata_block_picture') == [encoded]:
+                return False
+            audio['metadata_block_picture'] = [encoded]
+        else:
+            if audio.tags is None:
+                audio.add_tags()
+            if isinstance(audio, MP4):
+                existing = audio.tags.get('covr', [])
+                if len(existing) == 1 and bytes(existing[0]) == art:
+                    return False
+                audio.tags['covr'] = [MP4Cover(art, imageformat=MP4Cover.FORMAT_JPEG)]
+            elif isinstance(audio.tags, ID3):
+                existing = audio.tags.getall('APIC')
+                if len(existing) == 1 and existing[0].data == art:
+                    return False
+                audio.tags.delall('APIC')
+                audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=art))
+            else:
+                print(f"Cover art is not supported for {file_path}.")
+                return False
+        audio.save()
+        return True
+    except Exception as e:
+        print(f"Error embedding cover art in {file_path}: {e}")
+        return False
+
+def embed_release_art(file_releases, workers=ART_WORKERS, art_cache=None):
+    """
+    Bulk artwork stage. Takes (file path, release id) pairs, fetches each distinct
+    release's cover once and embeds it into all of that release's tracks, in parallel.
+    Returns the number of files written.
+    """
+    art_cache = cover_art_cache if art_cache is None else art_cache
+    files_by_release = {}
+    for file_path, release_id in file_releases:
+        files_by_release.setdefault(release_id, []).append(file_path)
+    print(f"Embedding cover art for {len(files_by_release)} releases.")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        arts = dict(zip(files_by_release, executor.map(art_cache.get, files_by_release)))
+        jobs = [(file_path, arts[release_id]) for release_id, file_paths in files_by_release.items()
+                if arts[release_id] is not None for file_path in file_paths]
+        return sum(executor.map(lambda job: embed_cover_art(*job), jobs))
+
+def embed_library_art(table_path):
+    """Embeds cover art into every matched track of a saved library table."""
+    connect_lookup_service()
+    table = LibraryTable.load(table_path)
+    paths, release_ids = table.columns['path'], table.columns['release_id']
+    matched = table.where('release_id', lambda release_id: release_id > 0)
+    written = embed_release_art((paths[row], release_ids[row]) for row in matched)
+    print(f"Embedded cover art in {written} of {len(matched)} matched tracks.")
+
+def process_music_file(file_path):
+    """
+    Runs one file through the pipeline: tag reading, Discogs lookup, tagging and cover art.
+    Returns True if the file was tagged.
+    """
+    tags = clean_music_file(file_path)
+    if tags is None:
+        return False
+    query = format_query(tags['artist'], tags['title'])
+    if not normalize_search_query(query):
+        print(f"Skipping {file_path}: no artist or title tags.")
+        return False
+    releases = cached_search_discogs(query)
+    if not releases:
+        return False
+    best, score = rank_releases(normalize_search_query(query), releases)
+    if score < MIN_MATCH_SCORE:
+        print(f"Skipping {file_path}: best match '{getattr(best, 'title', '')}' scored {score:.2f}.")
+        return False
+    if not tag_music_file(file_path, best.id):
+        return False
+    art = cover_art_cache.get(best.id)
+    if art is not None:
+        embed_cover_art(file_path, art)
+    return True
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+class InotifyWatcher:
+    """
+    Recursive inotify watch over the library roots (Linux only). Files are reported
+    once they have gone WATCH_SETTLE_SECONDS without events, so a burst such as an
+    album copy is coalesced into one report per file. At most WATCH_MAX_PENDING files
+    are tracked; beyond that, or if the kernel queue overflows, the roots are rescanned
+    once there is room, reporting only files changed since the overflow began that
+    have not been handed off since.
+    """
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, roots, settle_seconds=WATCH_SETTLE_SECONDS):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.roots = roots
+        self.settle_seconds = settle_seconds
+        self.watches = {}   # Watch descriptor -> directory path
+        self.pending = {}   # File path -> time of its last event
+        self.needs_rescan = False
+        # Change time of the newest file handed off; files already there when watching started count as done
+        self.newest_change = time.time()
+        self.rescan_after = None     # newest_change when events were first lost
+        self.handed_off_since = {}   # File path -> change time, for files handed off after that
+        for root in roots:
+            self._watch_tree(root, report_existing=False)
+
+    def close(self):
+        os.close(self.fd)
+
+    @staticmethod
+    def _change_time(stat):
+        # ctime also moves for copies that preserve mtime (cp -p, rsync -t)
+        return max(stat.st_mtime, stat.st_ctime)
+
+    def _flag_rescan(self):
+        if self.rescan_after is None:
+            self.rescan_after = self.newest_change
+        self.needs_rescan = True
+
+    def _watch_tree(self, root, report_existing, changed_after=None):
+        for dir_path, _, file_names in os.walk(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.WATCH_MASK)
+            if wd < 0:
+                print(f"Could not watch {dir_path}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self.watches[wd] = dir_path
+            if not report_existing:
+                continue
+            for file_name in file_names:
+                file_path = os.path.join(dir_path, file_name)
+                if changed_after is not None:
+                    try:
+                        change_time = self._change_time(os.stat(file_path))
+                    except OSError:
+                        continue
+                    if change_time <= changed_after or self.handed_off_since.get(file_path) == change_time:
+                        continue
+                self._mark_pending(file_path)
+
+    def _mark_pending(self, file_path):
+        if not file_path.lower().endswith(MUSIC_FILE_EXTENSIONS):
+            return
+        if file_path not in self.pending and len(self.pending) >= WATCH_MAX_PENDING:
+            self._flag_rescan()  # Picked up by the rescan once the backlog drains
+            return
+        self.pending[file_path] = time.monotonic()
+
+    def defer(self, file_path):
+        """Puts a settled file back to be reported again later, e.g. while the pipeline is full."""
+        self.pending[file_path] = time.monotonic()
+
+    def handed_off(self, file_path, stat):
+        """Records that a file was handed to the pipeline, so rescans can skip it."""
+        change_time = self._change_time(stat)
+        self.newest_change = max(self.newest_change, change_time)
+        if self.rescan_after is not None:
+            self.handed_off_since[file_path] = change_time
+
+    def _read_events(self):
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                print("inotify queue overflowed, library roots will be rescanned for changed files.")
+                self._flag_rescan()
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            dir_path = self.watches.get(wd)
+            if dir_path is None or not name:
+                continue
+            path = os.path.join(dir_path, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files copied into a new directory before its watch was added
+                    self._watch_tree(path, report_existing=True)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._mark_pending(path)
+
+    def settled_files(self, timeout):
+        """
+        Waits up to timeout seconds for events and returns (path, stat) for the files
+        that have settled. While WATCH_MAX_PENDING files are waiting, the kernel queue
+        is left unread.
+        """
+        if self.needs_rescan and len(self.pending) < WATCH_MAX_PENDING // 2:
+            self.needs_rescan = False
+            for root in self.roots:
+                self._watch_tree(root, report_existing=True, changed_after=self.rescan_after)
+            if not self.needs_rescan:
+                # Everything lost has been found again; otherwise the next rescan reuses the threshold
+                self.rescan_after = None
+                self.handed_off_since = {}
+        if len(self.pending) < WATCH_MAX_PENDING:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+            if readable:
+                self._read_events()
+        else:
+            time.sleep(timeout)
+        now = time.monotonic()
+        settled = []
+        for path in [path for path, last_event in self.pending.items() if now - last_event >= self.settle_seconds]:
+            del self.pending[path]
+            try:
+                settled.append((path, os.stat(path)))
+            except OSError:
+                pass  # Removed or renamed before it settled
+        return settled
+
+def watch_library(roots):
+    """
+    Long-running watch mode. New or changed files under the library roots are pushed
+    through process_music_file() by a worker thread. The hand-off queue is bounded;
+    while it is full, settled files wait in the watcher, which keeps draining inotify
+    events until its own pending limit is reached.
+    """
+    connect_lookup_service()
+    watcher = InotifyWatcher(roots)
+    file_queue = queue.Queue(maxsize=WATCH_QUEUE_SIZE)
+    tagged_mtimes = {}  # Files we wrote ourselves, so their own events are ignored
+    tagged_lock = threading.Lock()
+
+    def worker():
+        while True:
+            file_path = file_queue.get()
+            try:
+                if process_music_file(file_path):
+                    with tagged_lock:
+                        tagged_mtimes[file_path] = os.stat(file_path).st_mtime
+            except Exception as e:
+                print(f"Error processing {file_path}: {e}")
+            finally:
+                file_queue.task_done()
+
+    threading.Thread(target=worker, daemon=True).start()
+    print(f"Watching {', '.join(roots)} for new music files. Press Ctrl+C to stop.")
+    try:
+        while True:
+            for file_path, stat in watcher.settled_files(timeout=watcher.settle_seconds / 2):
+                with tagged_lock:
+                    if tagged_mtimes.pop(file_path, None) == stat.st_mtime:
+                        continue
+                try:
+                    file_queue.put_nowait(file_path)
+                except queue.Full:
+                    watcher.defer(file_path)
+                else:
+                    watcher.handed_off(file_path, stat)
+    except KeyboardInterrupt:
+        print("Stopping watch mode.")
+    finally:
+        watcher.close()
+
+class WorkQueue:
+    """
+    Durable job queue in a SQLite file that any number of worker processes or hosts
+    (on shared storage) can pull from. Jobs are leased rather than removed, so a
+    crashed worker's job is retried once its lease expires. Enqueueing is idempotent
+    per dedupe key and completion only counts for the worker holding the lease.
+    """
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                dedupe_key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_after REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, run_after);
+            CREATE TABLE IF NOT EXISTS rate_budgets (
+                token_hash TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                used INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS lookups (
+                query TEXT PRIMARY KEY,
+                releases TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS finished_files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL
+            );
+        """)
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so two workers never lease the same job
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def enqueue(self, kind, payload, dedupe_key):
+        """Adds a job unless one with the same dedupe key already exists."""
+        self.db.execute("INSERT OR IGNORE INTO jobs (kind, dedupe_key, payload) VALUES (?, ?, ?)",
+                        (kind, dedupe_key, json.dumps(payload)))
+
+    def enqueue_many(self, jobs):
+        """Adds (kind, payload, dedupe_key) jobs in a single transaction."""
+        self._transaction()
+        try:
+            self.db.executemany("INSERT OR IGNORE INTO jobs (kind, dedupe_key, payload) VALUES (?, ?, ?)",
+                                [(kind, dedupe_key, json.dumps(payload)) for kind, payload, dedupe_key in jobs])
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def lease(self, owner, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        """
+        Leases the next ready job (or one whose lease expired). Returns (id, kind, payload) or None.
+        Jobs whose lease expired max_attempts times (e.g. they keep killing their worker) are marked failed.
+        """
+        now = time.time()
+        self._transaction()
+        try:
+            self.db.execute("""
+                UPDATE jobs SET state = 'failed', lease_owner = NULL, lease_expires = NULL,
+                    error = 'Lease expired after the last attempt'
+                WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?""", (now, max_attempts))
+            row = self.db.execute("""
+                SELECT id, kind, payload FROM jobs
+                WHERE (state = 'queued' AND run_after <= ?) OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY id LIMIT 1""", (now, now)).fetchone()
+            if row is not None:
+                self.db.execute("""
+                    UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE id = ?""", (owner, now + lease_seconds, row[0]))
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def complete(self, job_id, owner):
+        """Marks a job done. Returns False if the lease was lost to another worker."""
+        cursor = self.db.execute("""
+            UPDATE jobs SET state = 'done', lease_owner = NULL, lease_expires = NULL
+            WHERE id = ? AND state = 'leased' AND lease_owner = ?""", (job_id, owner))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, owner, error, max_attempts=JOB_MAX_ATTEMPTS):
+        """Requeues a failed job with exponential backoff, or marks it failed after max_attempts."""
+        self.db.execute("""
+            UPDATE jobs SET
+                state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                run_after = ? + (1 << MIN(attempts, 10)),
+                lease_owner = NULL, lease_expires = NULL, error = ?
+            WHERE id = ? AND state = 'leased' AND lease_owner = ?""",
+            (max_attempts, time.time(), str(error), job_id, owner))
+
+    def pending_count(self):
+        return self.db.execute("SELECT COUNT(*) FROM jobs WHERE state IN ('queued', 'leased')").fetchone()[0]
+
+    def counts(self):
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def acquire_rate(self, token, per_minute=DISCOGS_REQUESTS_PER_MINUTE):
+        """
+        Takes one request from a token's shared per-minute budget, sleeping until
+        the next window when every worker together has used it up. Budgets are keyed
+        by a hash so the token itself is never written to the queue database.
+        """
+        token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+        while True:
+            now = time.time()
+            self._transaction()
+            try:
+                row = self.db.execute("SELECT window_start, used FROM rate_budgets WHERE token_hash = ?", (token_hash,)).fetchone()
+                if row is None or now - row[0] >= 60:
+                    self.db.execute("INSERT OR REPLACE INTO rate_budgets (token_hash, window_start, used) VALUES (?, ?, 1)", (token_hash, now))
+                    wait = 0
+                elif row[1] < per_minute:
+                    self.db.execute("UPDATE rate_budgets SET used = used + 1 WHERE token_hash = ?", (token_hash,))
+                    wait = 0
+                else:
+                    wait = row[0] + 60 - now
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def get_lookup(self, query):
+        row = self.db.execute("SELECT releases FROM lookups WHERE query = ?", (query,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def store_lookup(self, query, releases):
+        self.db.execute("INSERT OR REPLACE INTO lookups (query, releases) VALUES (?, ?)", (query, json.dumps(releases)))
+
+    def mark_file_finished(self, file_path):
+        """Records that a file went through the pipeline, so scans skip it until it changes again."""
+        self.db.execute("INSERT OR REPLACE INTO finished_files (path, mtime) VALUES (?, ?)",
+                        (file_path, os.stat(file_path).st_mtime))
+
+    def is_file_finished(self, file_path, mtime):
+        row = self.db.execute("SELECT mtime FROM finished_files WHERE path = ?", (file_path,)).fetchone()
+        return row is not None and row[0] == mtime
+
+def charge_request():
+    if request_budget is not None:
+        request_budget()
+
+def throttle_client(client):
+    """
+    Charges the rate budget for every HTTP request a discogs_client Client sends.
+    Searches, pages and releases are fetched lazily on attribute access, so this
+    is the only place every request passes through.
+    """
+    send_request = client._request
+    def throttled_request(*args, **kwargs):
+        charge_request()
+        return send_request(*args, **kwargs)
+    client._request = throttled_request
+    return client
+
+def file_job_key(kind, file_path):
+    """Dedupe key for a per-file job; a file modified since is treated as new work."""
+    return f"{kind}:{file_path}:{os.stat(file_path).st_mtime}"
+
+def scan_job(dir_path, scan_id):
+    """A scan job for one directory; scan_id ties the jobs of one --enqueue run together."""
+    return 'scan', {'dir': dir_path, 'scan': scan_id}, f"scan:{dir_path}:{scan_id}"
+
+def run_scan_job(work_queue, token, payload):
+    # One job per directory keeps every scan well inside its lease, however large the library
+    jobs = []
+    with os.scandir(payload['dir']) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                jobs.append(scan_job(entry.path, payload['scan']))
+            elif entry.name.lower().endswith(MUSIC_FILE_EXTENSIONS):
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue  # Removed since the directory was listed
+                # Files we tagged have a new mtime, so finished files are checked by path
+                if work_queue.is_file_finished(entry.path, mtime):
+                    continue
+                jobs.append(('lookup', {'path': entry.path}, f"lookup:{entry.path}:{mtime}"))
+    if jobs:
+        work_queue.enqueue_many(jobs)
+
+def run_lookup_job(work_queue, token, payload):
+    tags = clean_music_file(payload['path'])
+    if tags is None:
+        raise RuntimeError(f"Could not read tags from {payload['path']}")
+    search_text = format_query(tags['artist'], tags['title'])
+    query = normalize_search_query(search_text)
+    if not query:
+        work_queue.mark_file_finished(payload['path'])
+        return
+    # Lookups are shared through the queue database so each query is searched once across all workers
+    if work_queue.get_lookup(query) is None:
+        results = search_discogs(search_text)
+        if results is None:
+            raise RuntimeError(f"Search for '{search_text}' failed")
+        releases = [{'id': release.id, 'title': getattr(release, 'title', '')} for release in results]
+        work_queue.store_lookup(query, releases)
+    work_queue.enqueue('rank', {'path': payload['path'], 'query': query}, file_job_key('rank', payload['path']))
+
+def run_rank_job(work_queue, token, payload):
+    releases = work_queue.get_lookup(payload['query']) or []
+    if not releases:
+        work_queue.mark_file_finished(payload['path'])
+        return
+    best, score = rank_releases(payload['query'], releases)
+    if score < MIN_MATCH_SCORE:
+        print(f"Leaving {payload['path']} untagged: best match '{best['title']}' scored {score:.2f}.")
+        work_queue.mark_file_finished(payload['path'])
+        return
+    work_queue.enqueue('tag', {'path': payload['path'], 'release_id': best['id'], 'score': score},
+                       file_job_key('tag', payload['path']))
+
+def run_tag_job(work_queue, token, payload):
+    if not tag_music_file(payload['path'], payload['release_id']):
+        raise RuntimeError(f"Could not tag {payload['path']}")
+    art = cover_art_cache.get(payload['release_id'])
+    if art is not None:
+        embed_cover_art(payload['path'], art)
+    work_queue.mark_file_finished(payload['path'])
+
+JOB_HANDLERS = {
+    'scan': run_scan_job,
+    'lookup': run_lookup_job,
+    'rank': run_rank_job,
+    'tag': run_tag_job,
+}
+
+def run_worker(db_path, token=None, exit_when_idle=False, poll_seconds=1.0):
+    """
+    Pulls jobs from the queue until interrupted, or until no work is left when
+    exit_when_idle is set. Each token gets its own Discogs client and rate budget,
+    charged once per API request by every worker using it.
+    """
+    global d, request_budget
+    token = token or config.DISCOGS_USER_TOKEN
+    d = throttle_client(discogs_client.Client('YourApp/1.0', user_token=token))
+    work_queue = WorkQueue(db_path)
+    request_budget = lambda: work_queue.acquire_rate(token)
+    owner = f"{os.uname().nodename}:{os.getpid()}"
+    while True:
+        job = work_queue.lease(owner)
+        if job is None:
+            if exit_when_idle and work_queue.pending_count() == 0:
+                negative_cache.save()  # Worker processes exit without running atexit handlers
+                return
+            time.sleep(poll_seconds)
+            continue
+        job_id, kind, payload = job
+        try:
+            JOB_HANDLERS[kind](work_queue, token, payload)
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed: {e}")
+            work_queue.fail(job_id, owner, e)
+        else:
+            work_queue.complete(job_id, owner)
+
+def run_workers(db_path, count, token=None):
+    """Runs count local worker processes until the queue is drained."""
+    workers = [multiprocessing.Process(target=run_worker, args=(db_path, token, True)) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    print(f"Queue drained: {WorkQueue(db_path).counts()}")
+
+class RateLimiter:
+    """
+    Sliding-window budget for Discogs API requests from all threads. Up to per_minute
+    requests go out immediately; after that each request waits until the oldest one
+    sent within the last minute leaves the window.
+    """
+    def __init__(self, per_minute=DISCOGS_REQUESTS_PER_MINUTE, window_seconds=60.0):
+        self.per_minute = per_minute
+        self.window_seconds = window_seconds
+        self.lock = threading.Lock()
+        self.sent = deque()  # Monotonic send times within the current window, oldest first
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.sent and now - self.sent[0] >= self.window_seconds:
+                    self.sent.popleft()
+                if len(self.sent) < self.per_minute:
+                    self.sent.append(now)
+                    return
+                delay = self.sent[0] + self.window_seconds - now
+            time.sleep(delay)
+
+discogs_rate_limiter = RateLimiter()
+# Called before every Discogs API request. Direct mode and the lookup service use this
+# process's limiter; run_worker() points it at the queue's shared per-token budget.
+request_budget = discogs_rate_limiter.wait
+throttle_client(d)
+
+# Base URL of the local lookup service, or None to talk to Discogs directly
+lookup_service = None
+# Fully fetched releases by id, least recently used dropped beyond RELEASE_CACHE_SIZE
+release_cache = OrderedDict()
+release_cache_lock = threading.Lock()
+# Releases being fetched, so concurrent lookups of the same id wait for one request
+release_inflight = {}
+
+def connect_lookup_service(host=LOOKUP_SERVICE_HOST, port=LOOKUP_SERVICE_PORT):
+    """Switches to the local lookup service if one is running, otherwise stays in direct mode."""
+    global lookup_service
+    url = f"http://{host}:{port}"
+    try:
+        requests.get(f"{url}/health", timeout=0.5).raise_for_status()
+    except Exception:
+        print("Lookup service not running, using Discogs directly.")
+        return False
+    print(f"Using lookup service at {url}.")
+    lookup_service = url
+    return True
+
+def release_to_json(release, details=False):
+    """Serializes the Release fields the viewers and tagger use."""
+    data = {
+        'id': release.id,
+        'title': getattr(release, 'title', 'N/A'),
+        'year': getattr(release, 'year', None),
+        'artists': [artist.name for artist in (release.artists or [])],
+        'images': [{'uri': image['uri']} for image in (release.images or [])],
+    }
+    if details:
+        data['genres'] = release.genres or []
+        data['tracklist'] = [{'title': track.title, 'duration': track.duration} for track in (release.tracklist or [])]
+    return data
+
+def release_from_json(data):
+    """Builds an object with the same attributes as a discogs_client Release."""
+    release = SimpleNamespace(**data)
+    release.artists = [SimpleNamespace(name=name) for name in data['artists']]
+    if 'tracklist' in data:
+        release.tracklist = [SimpleNamespace(**track) for track in data['tracklist']]
+    return release
+
+def service_get(path, **params):
+    """
+    Sends a request to the lookup service. If the service cannot be reached it is
+    dropped for the rest of the session and None is returned, so the caller can
+    fall back to direct mode. Errors reported by the service are raised.
+    """
+    global lookup_service
+    try:
+        response = requests.get(f"{lookup_service}{path}", params=params, timeout=LOOKUP_SERVICE_TIMEOUT)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        print(f"Lookup service unavailable ({e}), using Discogs directly.")
+        lookup_service = None
+        return None
+    response.raise_for_status()
+    return response
+
+def remote_search(query, page=1):
+    """Searches through the lookup service. Returns None if the search failed or the service is gone."""
+    try:
+        response = service_get('/search', q=query, page=page)
+        if response is None:
+            return None
+        return [release_from_json(data) for data in response.json()]
+    except Exception as e:
+        print(f"An unexpected error occurred during search: {e}")
+        return None
+
+def lookup_release(release_id):
+    """Returns full release details, from the lookup service when connected."""
+    if lookup_service is not None:
+        response = service_get('/release', id=release_id)
+        if response is not None:
+            return release_from_json(response.json())
+    while True:
+        with release_cache_lock:
+            if release_id in release_cache:
+                release_cache.move_to_end(release_id)
+                return release_cache[release_id]
+            done_event = release_inflight.get(release_id)
+            if done_event is None:
+                done_event = threading.Event()
+                release_inflight[release_id] = done_event
+                break
+        done_event.wait()
+    try:
+        release = d.release(release_id)
+        # d.release() is lazy; fetch now so threads sharing the object never fetch it themselves
+        release.refresh()
+        with release_cache_lock:
+            release_cache[release_id] = release
+            while len(release_cache) > RELEASE_CACHE_SIZE:
+                release_cache.popitem(last=False)
+    finally:
+        with release_cache_lock:
+            del release_inflight[release_id]
+        done_event.set()
+    return release
+
+def fetch_image_data(image_url):
+    """Downloads image bytes, through the lookup service's shared image cache when connected."""
+    if lookup_service is not None:
+        response = service_get('/image', uri=image_url)
+        if response is not None:
+            return response.content
+    # Images come from the Discogs CDN, which does not count against the API rate limit
+    headers = {'User-Agent': 'YourApp/1.0'}
+    response = requests.get(image_url, headers=headers)
+    response.raise_for_status()
+    return response.content
+
+class LookupServiceHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the lookup service:
+      GET /health
+      GET /search?q=<query>&page=<n>  -> list of releases
+      GET /release?id=<release id>    -> release details
+      GET /image?uri=<image url>      -> raw image bytes
+    """
+    image_cache = OrderedDict()
+    image_cache_lock = threading.Lock()
+    json_cache = OrderedDict()  # Serialized search results and releases, keyed by request
+    json_cache_lock = threading.Lock()
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            if url.path == '/health':
+                self._send(b'{}', 'application/json')
+            elif url.path == '/search':
+                query = params.get('q', '')
+                key = ('search', normalize_search_query(query), int(params.get('page', 1)))
+                self._send_json(key, lambda: [release_to_json(release) for release in self._search(query, key[2])])
+            elif url.path == '/release':
+                key = ('release', int(params['id']))
+                self._send_json(key, lambda: release_to_json(lookup_release(key[1]), details=True))
+            elif url.path == '/image':
+                self._send(self._image(params['uri']), 'image/jpeg')
+            else:
+                self.send_error(404)
+        except Exception as e:
+            self.send_error(502, str(e))
+
+    @staticmethod
+    def _search(query, page):
+        results = cached_search_discogs(query, page=page)
+        if results is None:
+            raise RuntimeError(f"Search for '{query}' failed")
+        return results
+
+    def _send_json(self, key, build):
+        """Sends a cached response, building it on a miss. Failures raise and are never cached."""
+        with self.json_cache_lock:
+            body = self.json_cache.get(key)
+            if body is not None:
+                self.json_cache.move_to_end(key)
+        if body is None:
+            body = json.dumps(build()).encode('utf-8')
+            with self.json_cache_lock:
+                self.json_cache[key] = body
+                while len(self.json_cache) > LOOKUP_SERVICE_JSON_CACHE_SIZE:
+                    self.json_cache.popitem(last=False)
+        self._send(body, 'application/json')
+
+    def _image(self, uri):
+        with self.image_cache_lock:
+            if uri in self.image_cache:
+                self.image_cache.move_to_end(uri)
+                return self.image_cache[uri]
+        data = fetch_image_data(uri)
+        with self.image_cache_lock:
+            self.image_cache[uri] = data
+            while len(self.image_cache) > LOOKUP_SERVICE_IMAGE_CACHE_SIZE:
+                self.image_cache.popitem(last=False)
+        return data
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_lookup_service(host=LOOKUP_SERVICE_HOST, port=LOOKUP_SERVICE_PORT):
+    """
+    Runs the local lookup daemon. All clients share its search, release and image
+    caches and its single Discogs rate limiter.
+    """
+    server = ThreadingHTTPServer((host, port), LookupServiceHandler)
+    print(f"Lookup service listening on http://{host}:{port}. Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping lookup service.")
+    finally:
+        server.server_close()
+
 class InputBox:
     def __init__(self, x, y, w, h, text=''):
         self.rect = pygame.Rect(x, y, w, h)
@@ -129,6 +1901,7 @@ class ResultsViewer:
         self.back_button = Button(10, 10, 100, 32, "Back")
         self.select_button = Button(screen.get_width() - 110, screen.get_height() - 42, 100, 32, "Select")
         self.next_button = Button(screen.get_width() - 220, screen.get_height() - 42, 100, 32, "Next 10")
+        self.prev_button = Button(screen.get_width() - 330, screen.get_height() - 42, 100, 32, "Prev 10")
         
         self.checkboxes = []
         self.images = self._load_images()
@@ -137,7 +1910,7 @@ class ResultsViewer:
             self.checkboxes.append(Checkbox(50, y_offset + 15, 20, 20))
             y_offset += 60
         
-        self.focusable_widgets = self.checkboxes + [self.back_button, self.select_button, self.next_button]
+        self.focusable_widgets = self.checkboxes + [self.back_button, self.select_button, self.prev_button, self.next_button]
         self.focused_index = 0
         if self.focusable_widgets:
             self.focusable_widgets[self.focused_index].focused = True
@@ -149,11 +1922,7 @@ class ResultsViewer:
             if hasattr(result, 'images') and result.images:
                 image_url = result.images[0]['uri']
                 try:
-                    headers = {'User-Agent': 'YourApp/1.0'}
-                    response = requests.get(image_url, headers=headers)
-                    response.raise_for_status()
-                    image_data = response.content
-                    image_file = io.BytesIO(image_data)
+                    image_file = io.BytesIO(fetch_image_data(image_url))
                     image_surface = pygame.image.load(image_file)
                 except Exception as e:
                     print(f"Error loading image: {e}")
@@ -182,6 +1951,8 @@ class ResultsViewer:
                     return "back", None
                 elif focused_widget == self.next_button:
                     return "next_page", None
+                elif focused_widget == self.prev_button:
+                    return "prev_page", None
 
         for cb in self.checkboxes:
             cb.handle_event(event, self.checkboxes)
@@ -195,6 +1966,8 @@ class ResultsViewer:
                         return "view_details", self.results[i]
             if self.next_button.rect.collidepoint(event.pos):
                 return "next_page", None
+            if self.prev_button.rect.collidepoint(event.pos):
+                return "prev_page", None
 
         return None, None
 
@@ -220,6 +1993,49 @@ class ResultsViewer:
         self.back_button.draw(self.screen)
         self.select_button.draw(self.screen)
         self.next_button.draw(self.screen)
+        self.prev_button.draw(self.screen)
+
+    def memory_size(self):
+        """Approximate bytes held by this page: decoded thumbnails plus the release data behind each result."""
+        size = sum(image.get_width() * image.get_height() * image.get_bytesize() for image in self.images)
+        for result in self.results:
+            try:
+                size += len(json.dumps(getattr(result, 'data', None) or {}))
+            except (TypeError, ValueError):
+                pass
+        return size
+
+class PageHistory:
+    """
+    Keeps constructed ResultsViewer pages keyed by (query, page) so revisiting a page
+    restores its results, thumbnails and checkbox state without re-downloading anything.
+    Least recently used pages are evicted once max_bytes or max_pages is exceeded.
+    """
+    def __init__(self, max_bytes=PAGE_HISTORY_MAX_BYTES, max_pages=PAGE_HISTORY_MAX_PAGES):
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        # (query, page) -> (viewer, size measured when the page was added)
+        self.pages = OrderedDict()
+        self.total_bytes = 0
+
+    def get(self, query, page):
+        entry = self.pages.get((query, page))
+        if entry is None:
+            return None
+        self.pages.move_to_end((query, page))
+        return entry[0]
+
+    def put(self, query, page, viewer):
+        key = (query, page)
+        if key in self.pages:
+            self.total_bytes -= self.pages.pop(key)[1]
+        size = viewer.memory_size()
+        self.pages[key] = (viewer, size)
+        self.total_bytes += size
+        # Always keep the page just added, even if it alone exceeds the caps
+        while len(self.pages) > 1 and (self.total_bytes > self.max_bytes or len(self.pages) > self.max_pages):
+            _, (_, evicted_size) = self.pages.popitem(last=False)
+            self.total_bytes -= evicted_size
 
 class DetailsViewer:
     def __init__(self, screen, result):
@@ -229,7 +2045,7 @@ class DetailsViewer:
         self.back_button = Button(10, 10, 100, 32, "Back")
         
         # Fetch full release details for comprehensive data
-        self.full_release = d.release(self.result.id) 
+        self.full_release = lookup_release(self.result.id)
         self.image_surface = self._load_image()
         self.song_length, self.genres = self._get_song_length_and_genres()
 
@@ -237,11 +2053,7 @@ class DetailsViewer:
         if hasattr(self.full_release, 'images') and self.full_release.images:
             image_url = self.full_release.images[0]['uri']
             try:
-                headers = {'User-Agent': 'YourApp/1.0'}
-                response = requests.get(image_url, headers=headers)
-                response.raise_for_status()
-                image_data = response.content
-                image_file = io.BytesIO(image_data)
+                image_file = io.BytesIO(fetch_image_data(image_url))
                 return pygame.image.load(image_file)
             except Exception as e:
                 print(f"Error loading image: {e}")
@@ -315,6 +2127,7 @@ class DetailsViewer:
 
 def main():
     global FONT, COLOR_INACTIVE, COLOR_ACTIVE
+    connect_lookup_service()
     pygame.init()
     screen = pygame.display.set_mode((1280, 720))
     FONT = pygame.font.Font(None, 32)
@@ -325,17 +2138,20 @@ def main():
     artist_box = InputBox(100, 100, 140, 32, 'Artist')
     title_box = InputBox(100, 200, 140, 32, 'Title')
     search_button = Button(100, 300, 140, 32, 'Search')
+    suggestion_searcher = SuggestionSearcher()
     
     focusable_widgets_input = [artist_box, title_box, search_button]
     focused_widget_index_input = 0
     focusable_widgets_input[focused_widget_index_input].focused = True
 
     results_viewer = None
+    page_history = PageHistory()
     details_viewer = None
     app_state = "input"
     search_query = ""
     current_page = 1
 
+    clock = pygame.time.Clock()
     done = False
     while not done:
         events = pygame.event.get()
@@ -360,7 +2176,7 @@ def main():
                     elif event.key == pygame.K_RETURN:
                         if focused_widget == search_button:
                             current_page = 1
-                            search_query = f"{artist_box.text} - {title_box.text}"
+                            search_query = build_search_query(artist_box, title_box)
                             app_state = "searching"
                 
                 if event.type == pygame.MOUSEBUTTONDOWN:
@@ -371,7 +2187,7 @@ def main():
                             widget.focused = True
                             if widget == search_button:
                                 current_page = 1
-                                search_query = f"{artist_box.text} - {title_box.text}"
+                                search_query = build_search_query(artist_box, title_box)
                                 app_state = "searching"
             
             elif app_state == "results":
@@ -380,10 +2196,17 @@ def main():
                     if action == "back":
                         app_state = "input"
                     elif action == "view_details":
-                        details_viewer = DetailsViewer(screen, data)
-                        app_state = "details"
+                        try:
+                            details_viewer = DetailsViewer(screen, data)
+                            app_state = "details"
+                        except Exception as e:
+                            print(f"Error loading release details: {e}")
                     elif action == "next_page":
-                        app_state = "searching_next_page"
+                        current_page += 1
+                        app_state = "searching"
+                    elif action == "prev_page" and current_page > 1:
+                        current_page -= 1
+                        app_state = "searching"
 
             elif app_state == "details":
                 if details_viewer:
@@ -391,23 +2214,34 @@ def main():
                     if action == "back_to_results":
                         app_state = "results"
 
+        if app_state == "input":
+            now_ms = pygame.time.get_ticks()
+            suggestion_searcher.update(build_search_query(artist_box, title_box), now_ms)
+            suggestion_searcher.tick(now_ms)
+
         screen.fill((30, 30, 30))
 
         if app_state == "input":
             for widget in focusable_widgets_input:
                 widget.draw(screen)
+            suggestion_searcher.draw(screen, 300, 100)
         
-        elif app_state == "searching" or app_state == "searching_next_page":
-            searching_text = FONT.render("Searching...", True, (255, 255, 255))
-            text_rect = searching_text.get_rect(center=screen.get_rect().center)
-            screen.blit(searching_text, text_rect)
-            pygame.display.flip() 
-            
-            if app_state == "searching_next_page":
-                current_page += 1
-            
-            results = search_discogs(search_query, page=current_page)
-            results_viewer = ResultsViewer(screen, results)
+        elif app_state == "searching":
+            history_key = normalize_search_query(search_query)
+            results_viewer = page_history.get(history_key, current_page)
+            if results_viewer is None:
+                searching_text = FONT.render("Searching...", True, (255, 255, 255))
+                text_rect = searching_text.get_rect(center=screen.get_rect().center)
+                screen.blit(searching_text, text_rect)
+                pygame.display.flip() 
+
+                results = cached_search_discogs(search_query, page=current_page)
+                results_viewer = ResultsViewer(screen, results or [])
+                # Failed searches are not kept so revisiting the page retries them
+                if results is not None:
+                    page_history.put(history_key, current_page, results_viewer)
+            else:
+                results_viewer.draw()
             app_state = "results"
 
         elif app_state == "results":
@@ -419,8 +2253,33 @@ def main():
                 details_viewer.draw()
 
         pygame.display.flip()
+        clock.tick(60)
 
     pygame.quit()
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 2 and sys.argv[1] == '--watch':
+        watch_library(sys.argv[2:])
+    elif len(sys.argv) > 3 and sys.argv[1] == '--scan':
+        # --scan <library table> <root>...
+        library = scan_library(sys.argv[3:])
+        library.save(sys.argv[2])
+        print(f"Saved {len(library)} tracks to {sys.argv[2]}.")
+    elif len(sys.argv) > 2 and sys.argv[1] == '--match':
+        # --match <library table>
+        match_library(sys.argv[2])
+    elif len(sys.argv) > 2 and sys.argv[1] == '--embed-art':
+        # --embed-art <library table>
+        embed_library_art(sys.argv[2])
+    elif len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve_lookup_service()
+    elif len(sys.argv) > 3 and sys.argv[1] == '--enqueue':
+        # --enqueue <queue.db> <root>...
+        work_queue = WorkQueue(sys.argv[2])
+        scan_id = time.time()
+        work_queue.enqueue_many([scan_job(root, scan_id) for root in sys.argv[3:]])
+    elif len(sys.argv) > 2 and sys.argv[1] == '--workers':
+        # --workers <queue.db> [count]
+        run_workers(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 1)
+    else:
+        main()
@@ -0,0 +1,119 @@
+"""
+Reproducible check of the work queue with several local worker processes.
+
+Builds a throwaway directory tree of empty .mp3 files, enqueues a scan of it and runs
+real worker processes (run_workers) against a temporary queue database. The lookup
+handler is replaced by one that only records which worker saw each file, so no Discogs
+requests are made. Checks that:
+  - every directory was scanned by its own job and every file looked up exactly once
+  - a lookup that fails once is retried and then finishes
+  - all workers charged one shared rate budget, stored under a hash of the token
+
+Usage: python work_queue_check.py [workers] [artist directories] [files per album]
+Workers are forked so they inherit the replaced handler, which needs Linux or macOS.
+"""
+import importlib.util
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+CLEANER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '0.00.05-Music_File_Cleaner.py')
+CHECK_TOKEN = 'work-queue-check-token'
+LOOKUP_SECONDS = 0.1  # Simulated lookup time, so jobs overlap across workers
+ALBUMS_PER_ARTIST = 2
+# Lookup that fails on its first attempt; set before the workers fork
+flaky_path = None
+
+def load_cleaner():
+    spec = importlib.util.spec_from_file_location('music_file_cleaner', CLEANER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def build_tree(root, artists, files_per_album):
+    """Creates root/artistN/albumM/trackK.mp3 and returns (directories, files)."""
+    directories, files = [root], []
+    for artist in range(artists):
+        artist_dir = os.path.join(root, f"artist{artist}")
+        directories.append(artist_dir)
+        for album in range(ALBUMS_PER_ARTIST):
+            album_dir = os.path.join(artist_dir, f"album{album}")
+            os.makedirs(album_dir)
+            directories.append(album_dir)
+            for track in range(files_per_album):
+                file_path = os.path.join(album_dir, f"track{track}.mp3")
+                open(file_path, 'wb').close()
+                files.append(file_path)
+    return directories, files
+
+def record_lookup(work_queue, token, payload):
+    """Stands in for run_lookup_job: charges the rate budget and records the file."""
+    work_queue.acquire_rate(token)
+    file_path = payload['path']
+    if file_path == flaky_path:
+        failures = work_queue.db.execute("SELECT COUNT(*) FROM check_failures WHERE path = ?", (file_path,)).fetchone()[0]
+        if failures == 0:
+            work_queue.db.execute("INSERT INTO check_failures (path) VALUES (?)", (file_path,))
+            raise RuntimeError("Simulated lookup failure")
+    time.sleep(LOOKUP_SECONDS)
+    work_queue.db.execute("INSERT INTO check_seen (path, pid) VALUES (?, ?)", (file_path, os.getpid()))
+
+def main():
+    global flaky_path
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    artists = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    files_per_album = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    work_dir = tempfile.mkdtemp(prefix='work_queue_check_')
+    # The cleaner keeps its negative cache in the working directory
+    os.chdir(work_dir)
+    cleaner = load_cleaner()
+    cleaner.JOB_HANDLERS['lookup'] = record_lookup
+    multiprocessing.set_start_method('fork')
+
+    directories, files = build_tree(os.path.join(work_dir, 'library'), artists, files_per_album)
+    flaky_path = files[0]
+    db_path = os.path.join(work_dir, 'queue.db')
+    work_queue = cleaner.WorkQueue(db_path)
+    work_queue.db.executescript("""
+        CREATE TABLE check_seen (path TEXT NOT NULL, pid INTEGER NOT NULL);
+        CREATE TABLE check_failures (path TEXT NOT NULL);
+    """)
+    work_queue.enqueue_many([cleaner.scan_job(directories[0], 1)])
+    print(f"Running {workers} workers over {len(directories)} directories and {len(files)} files in {work_dir}")
+    cleaner.run_workers(db_path, workers, CHECK_TOKEN)
+
+    db = sqlite3.connect(db_path)
+    problems = []
+    counts = dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+    if counts != {'done': len(directories) + len(files)}:
+        problems.append(f"Expected {len(directories) + len(files)} done jobs, got {counts}")
+    scanned = sorted(payload for (payload,) in db.execute("SELECT json_extract(payload, '$.dir') FROM jobs WHERE kind = 'scan'"))
+    if scanned != sorted(directories):
+        problems.append(f"Scan jobs do not match the directory tree: {scanned}")
+    seen = dict(db.execute("SELECT path, COUNT(*) FROM check_seen GROUP BY path").fetchall())
+    if seen != {file_path: 1 for file_path in files}:
+        problems.append(f"Files not looked up exactly once: {sorted(set(files) ^ set(seen))}, {[path for path, n in seen.items() if n != 1]}")
+    attempts = db.execute("SELECT attempts FROM jobs WHERE json_extract(payload, '$.path') = ?", (flaky_path,)).fetchone()
+    if attempts is None or attempts[0] != 2:
+        problems.append(f"Failing lookup should finish on its second attempt, got {attempts}")
+    budgets = db.execute("SELECT token_hash, used FROM rate_budgets").fetchall()
+    if len(budgets) != 1 or budgets[0][0] == CHECK_TOKEN or CHECK_TOKEN in budgets[0][0]:
+        problems.append(f"Expected one rate budget keyed by a token hash, got {budgets}")
+    elif budgets[0][1] != len(files) + 1:
+        problems.append(f"Expected {len(files) + 1} requests charged to the shared budget, got {budgets[0][1]}")
+    workers_used = db.execute("SELECT COUNT(DISTINCT pid) FROM check_seen").fetchone()[0]
+
+    if problems:
+        print("FAILED:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"OK: {len(files)} files looked up once each by {workers_used} workers, "
+          f"{len(directories)} directories scanned, failed lookup retried.")
+
+if __name__ == '__main__':
+    main()